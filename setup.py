@@ -176,7 +176,7 @@ def get_required_packages():
       'cloudpickle >= 1.3',
       'gin-config >= 0.4.0',
       'gym >= 0.17.0, <=0.23.0',
-      'numpy >= 1.13.3',
+      'numpy >= 1.17.0',
       'pillow',
       'six >= 1.10.0',
       'protobuf >= 3.11.3',
@@ -209,6 +209,7 @@ def get_test_packages():
       'ale-py',
       'atari-py',  # TODO(b/200012648) contains ALE/Tetris ROM for unit test.
       'mock >= 2.0.0',
+      'numba',
       'opencv-python >= 3.4.1.15',
       'pybullet',
       'scipy >= 1.1.0',
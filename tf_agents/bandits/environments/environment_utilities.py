@@ -148,6 +148,70 @@ def context_sampling_fn(batch_size, context_dim):
       -10, 10, [batch_size, context_dim]).astype(np.float32)
 
 
+@gin.configurable
+def make_uniform_int_sampler(low, high, shape, dtype=np.int64, rng=None):
+  """Returns a sampling function for uniformly distributed integer contexts.
+
+  The returned function can be called with no arguments to draw a single
+  context of shape `shape`, or with an integer `size` to draw `size` contexts
+  at once (see the `batched_sampling` argument of
+  `StationaryStochasticPerArmPyEnvironment`). Every call makes a single call to
+  the underlying `np.random.Generator`.
+
+  Args:
+    low: The lowest integer to be drawn (inclusive).
+    high: The highest integer to be drawn (exclusive).
+    shape: The shape of a single context.
+    dtype: The dtype of the returned contexts.
+    rng: An optional `np.random.Generator`. If not set, a new one is created.
+
+  Returns:
+    A function `sampler(size=None)` returning an array of shape `shape` or
+    `[size] + shape`.
+  """
+  rng = np.random.default_rng() if rng is None else rng
+  shape = tuple(shape)
+
+  def sampler(size=None):
+    batch_shape = shape if size is None else (size,) + shape
+    return np.asarray(rng.integers(low, high, batch_shape), dtype=dtype)
+
+  return sampler
+
+
+@gin.configurable
+def make_normal_sampler(shape, loc=0.0, scale=1.0, dtype=np.float32, rng=None):
+  """Returns a sampling function for normally distributed contexts.
+
+  Like `make_uniform_int_sampler`, the returned function draws a single
+  context when called without arguments, and `size` contexts at once when
+  called with an integer `size`.
+
+  Args:
+    shape: The shape of a single context.
+    loc: The mean of the normal distribution.
+    scale: The standard deviation of the normal distribution.
+    dtype: The dtype of the returned contexts. Must be `np.float32` or
+      `np.float64`.
+    rng: An optional `np.random.Generator`. If not set, a new one is created.
+
+  Returns:
+    A function `sampler(size=None)` returning an array of shape `shape` or
+    `[size] + shape`.
+  """
+  rng = np.random.default_rng() if rng is None else rng
+  shape = tuple(shape)
+
+  def sampler(size=None):
+    batch_shape = shape if size is None else (size,) + shape
+    samples = rng.standard_normal(batch_shape, dtype=dtype)
+    samples *= scale
+    samples += loc
+    return samples
+
+  return sampler
+
+
 @gin.configurable
 def build_laplacian_over_ordinal_integer_actions_from_env(env):
   return utils.build_laplacian_over_ordinal_integer_actions(env.action_spec())
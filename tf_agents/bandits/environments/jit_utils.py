@@ -0,0 +1,65 @@
+# coding=utf-8
+# Copyright 2020 The TF-Agents Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Optional numba compilation of user-provided environment functions."""
+
+import inspect
+from typing import Callable
+
+from absl import logging
+
+_TRY_IMPORT = True  # pylint: disable=g-statement-before-imports
+
+if _TRY_IMPORT:
+  try:
+    import numba  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    numba = None
+else:
+  import numba  # pylint: disable=g-import-not-at-top
+
+
+def is_available() -> bool:
+  """Returns whether numba is installed."""
+  return numba is not None
+
+
+def maybe_njit(fn: Callable[..., object]) -> Callable[..., object]:
+  """Compiles `fn` with `numba.njit` if possible, and returns it otherwise.
+
+  Only plain Python functions are compiled; other callables (e.g. instances of
+  classes implementing `__call__`) are returned unchanged, as is every function
+  when numba is not installed. Functions are compiled with `nogil=True`, so
+  they can run in parallel on the thread pool enabled by the environments'
+  `reward_fn_workers` argument. Compilation is lazy, so a function that numba
+  cannot type raises on its first call rather than here.
+
+  Note that numba keeps its own random state, so `np.random` calls inside a
+  compiled function are not affected by `np.random.seed`.
+
+  Args:
+    fn: The function to compile.
+
+  Returns:
+    The compiled function, or `fn` itself if it can not be compiled.
+  """
+  if numba is None:
+    logging.warning('numba is not installed; %s will not be compiled.', fn)
+    return fn
+  if not inspect.isfunction(fn):
+    logging.warning('Only Python functions can be compiled with numba; %s '
+                    'will not be compiled.', fn)
+    return fn
+  return numba.njit(fn, nogil=True)
@@ -0,0 +1,71 @@
+# coding=utf-8
+# Copyright 2020 The TF-Agents Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tf_agents.bandits.environments.jit_utils."""
+
+import numpy as np
+import tensorflow as tf  # pylint: disable=g-explicit-tensorflow-version-import
+from tf_agents.bandits.environments import jit_utils
+
+
+class SumReward(object):
+
+  def __call__(self, x):
+    return np.sum(x)
+
+
+class JitUtilsTest(tf.test.TestCase):
+
+  def test_callable_object_is_not_compiled(self):
+    reward_fn = SumReward()
+    self.assertIs(jit_utils.maybe_njit(reward_fn), reward_fn)
+
+  def test_function_is_returned_unchanged_without_numba(self):
+    if jit_utils.is_available():
+      self.skipTest('numba is installed.')
+
+    def _reward_fn(x):
+      return np.sum(x)
+
+    self.assertIs(jit_utils.maybe_njit(_reward_fn), _reward_fn)
+
+  def test_function_is_compiled_without_gil(self):
+    if not jit_utils.is_available():
+      self.skipTest('numba is not installed.')
+
+    def _reward_fn(x):
+      return np.sum(x)
+
+    compiled_reward_fn = jit_utils.maybe_njit(_reward_fn)
+    self.assertIsInstance(compiled_reward_fn,
+                          jit_utils.numba.core.dispatcher.Dispatcher)
+    self.assertIs(compiled_reward_fn.py_func, _reward_fn)
+    self.assertTrue(compiled_reward_fn.targetoptions['nogil'])
+
+  def test_compiled_function_matches_python_function(self):
+    if not jit_utils.is_available():
+      self.skipTest('numba is not installed.')
+
+    def _reward_fn(x):
+      return np.sum(x * x, axis=1)
+
+    compiled_reward_fn = jit_utils.maybe_njit(_reward_fn)
+    self.assertIsNot(compiled_reward_fn, _reward_fn)
+    features = np.arange(12, dtype=np.float64).reshape(3, 4)
+    self.assertAllClose(compiled_reward_fn(features), _reward_fn(features))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -15,12 +15,15 @@
 
 """Stationary Stochastic Python Bandit environment with per-arm features."""
 
-from typing import Optional, Callable, Sequence, Text
+from multiprocessing import dummy as mp_threads
+from typing import Optional, Callable, Sequence, Text, Tuple
 
+from absl import logging
 import gin
 import numpy as np
 
 from tf_agents.bandits.environments import bandit_py_environment
+from tf_agents.bandits.environments import jit_utils
 from tf_agents.bandits.specs import utils as bandit_spec_utils
 from tf_agents.specs import array_spec
 from tf_agents.typing import types
@@ -36,12 +39,17 @@ class StationaryStochasticPerArmPyEnvironment(
   """Stationary Stochastic Bandit environment with per-arm features."""
 
   def __init__(self,
-               global_context_sampling_fn: Callable[[], types.Array],
-               arm_context_sampling_fn: Callable[[], types.Array],
+               global_context_sampling_fn: Callable[..., types.Array],
+               arm_context_sampling_fn: Callable[..., types.Array],
                max_num_actions: int,
                reward_fn: Callable[[types.Array], Sequence[float]],
-               num_actions_fn: Optional[Callable[[], int]] = None,
+               num_actions_fn: Optional[Callable[..., types.Int]] = None,
                batch_size: Optional[int] = 1,
+               batched_sampling: bool = False,
+               vectorized_reward_fn: bool = False,
+               reuse_observation_buffers: bool = False,
+               jit_reward_fn: bool = False,
+               reward_fn_workers: int = 1,
                name: Optional[Text] = 'stationary_stochastic_per_arm'):
     """Initializes the environment.
 
@@ -54,17 +62,19 @@ class StationaryStochasticPerArmPyEnvironment(
     sample.
 
     Example:
+      rng = np.random.default_rng()
+
       def global_context_sampling_fn():
-        return np.random.randint(0, 10, [2])  # 2-dimensional global features.
+        return rng.integers(0, 10, [2])  # 2-dimensional global features.
 
       def arm_context_sampling_fn():
-        return np.random.randint(-3, 4, [3])  # 3-dimensional arm features.
+        return rng.integers(-3, 4, [3])  # 3-dimensional arm features.
 
       def reward_fn(x):
         return sum(x)
 
       def num_actions_fn():
-        return np.random.randint(2, 6)
+        return rng.integers(2, 6)
 
       env = StationaryStochasticPerArmPyEnvironment(global_context_sampling_fn,
                                                     arm_context_sampling_fn,
@@ -72,6 +82,17 @@ class StationaryStochasticPerArmPyEnvironment(
                                                     reward_fn,
                                                     num_actions_fn)
 
+    The same environment, drawing all contexts of a step with one call per
+    sampling function (see `environment_utilities.make_uniform_int_sampler`):
+
+      env = StationaryStochasticPerArmPyEnvironment(
+          environment_utilities.make_uniform_int_sampler(0, 10, [2], rng=rng),
+          environment_utilities.make_uniform_int_sampler(-3, 4, [3], rng=rng),
+          5,
+          reward_fn,
+          lambda size: rng.integers(2, 6, [size]),
+          batched_sampling=True)
+
     Args:
       global_context_sampling_fn: A function that outputs a random 1d array or
         list of ints or floats. This output is the global context. Its shape and
@@ -79,7 +100,9 @@ class StationaryStochasticPerArmPyEnvironment(
       arm_context_sampling_fn: A function that outputs a random 1 array or list
         of ints or floats (same type as the output of
         `global_context_sampling_fn`). This output is the per-arm context. Its
-        shape must be consistent across calls.
+        shape must be consistent across calls. Contexts are stored with the
+        dtype of the first sample, so sampling functions should return float32
+        rather than float64 arrays where possible.
       max_num_actions: (int) the maximum number of actions in every sample. If
         `num_actions_fn` is not set, this many actions are available in every
         time step.
@@ -91,31 +114,100 @@ class StationaryStochasticPerArmPyEnvironment(
         `max_num_actions`. The number of actions will be encoded in the
         observation by the feature key `num_actions`.
       batch_size: The batch size.
+      batched_sampling: If True, `global_context_sampling_fn`,
+        `arm_context_sampling_fn` and `num_actions_fn` (if set) are called with
+        a single integer argument `size` and must return an array with `size`
+        samples stacked along the first dimension. This replaces one Python
+        call per sample with one call per sampling function and step.
+      vectorized_reward_fn: If True, `reward_fn` is called once per step with
+        a `[batch_size, global_dim + arm_dim]` array holding the concatenated
+        features of every batch member, and must return `batch_size` rewards.
+      reuse_observation_buffers: If True, contexts are written into arrays
+        allocated once at construction time, and the same observation dict and
+        arrays are returned on every step. Callers that hold on to an
+        observation across steps (e.g. observers storing trajectories by
+        reference) must copy it.
+      jit_reward_fn: If True and numba is installed, `reward_fn` is compiled
+        with `numba.njit`. Only plain Python functions are compiled. Combined
+        with `vectorized_reward_fn`, the whole batch of rewards is computed in
+        compiled code.
+      reward_fn_workers: If larger than 1, the per-row calls of `reward_fn` are
+        distributed over a thread pool of this size. This only pays off if
+        `reward_fn` is expensive and releases the GIL (e.g. heavy NumPy code,
+        or a function compiled with `jit_reward_fn`). Ignored if
+        `vectorized_reward_fn` is True. Functions drawing from the global
+        `np.random` state on several threads are no longer reproducible under
+        `np.random.seed`. Call `close()` to release the pool.
       name: The name of this environment instance.
     """
+    # Set first, so that `close()` works even if the constructor raises.
+    self._pool = None
     self._global_context_sampling_fn = global_context_sampling_fn
     self._arm_context_sampling_fn = arm_context_sampling_fn
     self._max_num_actions = max_num_actions
-    self._reward_fn = reward_fn
+    self._reward_fn = (
+        jit_utils.maybe_njit(reward_fn) if jit_reward_fn else reward_fn)
     self._batch_size = batch_size
+    # Row indices used to gather the chosen arm features in `_apply_action`.
+    self._batch_arange = np.arange(batch_size, dtype=np.intp)
     self._num_actions_fn = num_actions_fn
+    self._batched_sampling = batched_sampling
+    self._vectorized_reward_fn = vectorized_reward_fn
+
+    if batched_sampling:
+      example_global_context = global_context_sampling_fn(1)[0]
+      example_arm_context = arm_context_sampling_fn(1)[0]
+    else:
+      example_global_context = global_context_sampling_fn()
+      example_arm_context = arm_context_sampling_fn()
+    global_context_spec = array_spec.ArraySpec.from_array(
+        example_global_context)
+    arm_context_spec = array_spec.ArraySpec.from_array(example_arm_context)
+    # The context shapes are fixed, so the batched observation shapes are
+    # computed once here instead of being inferred on every step.
+    self._global_obs_shape = (batch_size,) + global_context_spec.shape
+    self._arm_obs_shape = (
+        (batch_size, max_num_actions) + arm_context_spec.shape)
+    self._global_dtype = global_context_spec.dtype
+    self._arm_dtype = arm_context_spec.dtype
+    for key, dtype in ((GLOBAL_KEY, self._global_dtype),
+                       (PER_ARM_KEY, self._arm_dtype)):
+      if dtype == np.float64:
+        logging.warning(
+            'The %s sampling function returns float64 contexts. Returning '
+            'float32 halves the memory moved by every step.', key)
+    self._reuse_observation_buffers = reuse_observation_buffers
 
     observation_spec = {
         GLOBAL_KEY:
-            array_spec.ArraySpec.from_array(global_context_sampling_fn()),
+            global_context_spec,
         PER_ARM_KEY:
-            array_spec.add_outer_dims_nest(
-                array_spec.ArraySpec.from_array(arm_context_sampling_fn()),
-                (max_num_actions,))
+            array_spec.add_outer_dims_nest(arm_context_spec,
+                                           (max_num_actions,))
     }
     if self._num_actions_fn is not None:
+      if batched_sampling:
+        self._num_actions_dtype = np.asarray(self._num_actions_fn(1)).dtype
+      else:
+        self._num_actions_dtype = np.dtype(type(self._num_actions_fn()))
       num_actions_spec = array_spec.BoundedArraySpec(
           shape=(),
-          dtype=np.dtype(type(self._num_actions_fn())),
+          dtype=self._num_actions_dtype,
           minimum=1,
           maximum=max_num_actions)
       observation_spec.update({NUM_ACTIONS_KEY: num_actions_spec})
 
+    if reuse_observation_buffers:
+      self._global_buf = np.empty(self._global_obs_shape, self._global_dtype)
+      self._arm_buf = np.empty(self._arm_obs_shape, self._arm_dtype)
+      # The observation dict itself is also reused; `_observe` only overwrites
+      # the contents of the buffers it holds.
+      self._observation = {GLOBAL_KEY: self._global_buf,
+                           PER_ARM_KEY: self._arm_buf}
+      if self._num_actions_fn is not None:
+        self._num_actions_buf = np.empty(batch_size, self._num_actions_dtype)
+        self._observation[NUM_ACTIONS_KEY] = self._num_actions_buf
+
     action_spec = array_spec.BoundedArraySpec(
         shape=(),
         dtype=np.int32,
@@ -126,6 +218,15 @@ class StationaryStochasticPerArmPyEnvironment(
     super(StationaryStochasticPerArmPyEnvironment,
           self).__init__(observation_spec, action_spec, name=name)
 
+    # Only started once all arguments have been validated.
+    if reward_fn_workers > 1 and not vectorized_reward_fn:
+      self._pool = mp_threads.Pool(reward_fn_workers)
+
+    # All options and shapes are fixed from here on, so the per-step code is
+    # specialized once instead of re-checking them on every step.
+    self._observe_fn = self._make_observe_fn()
+    self._apply_action_fn = self._make_apply_action_fn()
+
   def batched(self) -> bool:
     return True
 
@@ -134,29 +235,185 @@ class StationaryStochasticPerArmPyEnvironment(
     return self._batch_size
 
   def _observe(self) -> types.NestedArray:
-    global_obs = np.stack(
-        [self._global_context_sampling_fn() for _ in range(self._batch_size)])
-    arm_obs = np.reshape([
-        self._arm_context_sampling_fn()
-        for _ in range(self._batch_size * self._max_num_actions)
-    ], (self._batch_size, self._max_num_actions, -1))
-    self._observation = {GLOBAL_KEY: global_obs, PER_ARM_KEY: arm_obs}
-
-    if self._num_actions_fn:
-      num_actions = [self._num_actions_fn() for _ in range(self._batch_size)]
-      num_actions = np.maximum(num_actions, 1)
-      num_actions = np.minimum(num_actions, self._max_num_actions)
-      self._observation.update({NUM_ACTIONS_KEY: num_actions})
+    self._observation = self._observe_fn()
     return self._observation
 
   def _apply_action(self, action: np.ndarray) -> types.Array:
-    if action.shape[0] != self.batch_size:
+    if action.shape[0] != self._batch_size:
       raise ValueError('Number of actions must match batch size.')
-    global_obs = self._observation[GLOBAL_KEY]  # pytype: disable=attribute-error  # trace-all-classes
-    batch_size_range = range(self.batch_size)
-    arm_obs = self._observation[PER_ARM_KEY][batch_size_range, action, :]  # pytype: disable=attribute-error  # trace-all-classes
-    reward = np.stack([
-        self._reward_fn(np.concatenate((global_obs[b, :], arm_obs[b, :])))
-        for b in batch_size_range
-    ])
-    return reward
+    return self._apply_action_fn(self._observation, action)
+
+  def _make_observe_fn(self) -> Callable[[], types.NestedArray]:
+    """Returns a function that samples a new observation."""
+    sample_contexts = self._make_context_sampler()
+    sample_num_actions = (
+        self._make_num_actions_sampler() if self._num_actions_fn else None)
+
+    if self._reuse_observation_buffers:
+      # The buffers referenced by the observation are filled in place.
+      observation = self._observation
+
+      if sample_num_actions is None:
+
+        def observe():
+          sample_contexts()
+          return observation
+      else:
+
+        def observe():
+          sample_contexts()
+          sample_num_actions()
+          return observation
+    elif sample_num_actions is None:
+
+      def observe():
+        global_obs, arm_obs = sample_contexts()
+        return {GLOBAL_KEY: global_obs, PER_ARM_KEY: arm_obs}
+    else:
+
+      def observe():
+        global_obs, arm_obs = sample_contexts()
+        return {
+            GLOBAL_KEY: global_obs,
+            PER_ARM_KEY: arm_obs,
+            NUM_ACTIONS_KEY: sample_num_actions()
+        }
+
+    return observe
+
+  def _make_context_sampler(
+      self) -> Callable[[], Tuple[np.ndarray, np.ndarray]]:
+    """Returns a function that samples the global and per-arm contexts."""
+    global_context_sampling_fn = self._global_context_sampling_fn
+    arm_context_sampling_fn = self._arm_context_sampling_fn
+    batch_size = self._batch_size
+    num_arm_contexts = self._batch_size * self._max_num_actions
+    global_obs_shape = self._global_obs_shape
+    arm_obs_shape = self._arm_obs_shape
+    flat_arm_obs_shape = (num_arm_contexts,) + arm_obs_shape[2:]
+    global_dtype = self._global_dtype
+    arm_dtype = self._arm_dtype
+
+    if self._batched_sampling:
+
+      def sample_batched_contexts():
+        global_obs = np.reshape(
+            global_context_sampling_fn(batch_size), global_obs_shape)
+        arm_obs = np.reshape(
+            arm_context_sampling_fn(num_arm_contexts), arm_obs_shape)
+        return global_obs, arm_obs
+
+      if not self._reuse_observation_buffers:
+        return sample_batched_contexts
+      global_buf = self._global_buf
+      arm_buf = self._arm_buf
+
+      def sample_contexts():
+        global_buf[...], arm_buf[...] = sample_batched_contexts()
+        return global_buf, arm_buf
+
+      return sample_contexts
+
+    if self._reuse_observation_buffers:
+      buffers = (self._global_buf, self._arm_buf)
+      allocate = lambda: buffers
+    else:
+
+      def allocate():
+        return (np.empty(global_obs_shape, global_dtype),
+                np.empty(arm_obs_shape, arm_dtype))
+
+    def sample_contexts_one_by_one():
+      global_obs, arm_obs = allocate()
+      # Write every sampled context directly into its row instead of building
+      # a list of small arrays and stacking it.
+      for b in range(batch_size):
+        global_obs[b] = global_context_sampling_fn()
+      flat_arm_obs = np.reshape(arm_obs, flat_arm_obs_shape)
+      for i in range(num_arm_contexts):
+        flat_arm_obs[i] = arm_context_sampling_fn()
+      return global_obs, arm_obs
+
+    return sample_contexts_one_by_one
+
+  def _make_num_actions_sampler(self) -> Callable[[], np.ndarray]:
+    """Returns a function that samples the number of actions of a step."""
+    num_actions_fn = self._num_actions_fn
+    batch_size = self._batch_size
+    max_num_actions = self._max_num_actions
+    dtype = self._num_actions_dtype
+
+    if self._batched_sampling:
+      # Always copy, since the result is clipped in place and the sampler may
+      # return a cached or read-only array.
+      draw = lambda: np.array(num_actions_fn(batch_size), dtype=dtype)
+    else:
+
+      def draw():
+        return np.fromiter((num_actions_fn() for _ in range(batch_size)),
+                           dtype=dtype,
+                           count=batch_size)
+
+    if self._reuse_observation_buffers:
+      num_actions_buf = self._num_actions_buf
+
+      def sample_num_actions():
+        num_actions_buf[...] = draw()
+        np.clip(num_actions_buf, 1, max_num_actions, out=num_actions_buf)
+        return num_actions_buf
+    else:
+
+      def sample_num_actions():
+        num_actions = draw()
+        np.clip(num_actions, 1, max_num_actions, out=num_actions)
+        return num_actions
+
+    return sample_num_actions
+
+  def _make_apply_action_fn(
+      self) -> Callable[[types.NestedArray, np.ndarray], np.ndarray]:
+    """Returns a function computing rewards from an observation and actions."""
+    reward_fn = self._reward_fn
+    batch_size = self._batch_size
+    batch_arange = self._batch_arange
+
+    def gather_features(observation, action):
+      arm_obs = observation[PER_ARM_KEY][batch_arange, action]
+      return np.concatenate([observation[GLOBAL_KEY], arm_obs], axis=1)
+
+    if self._vectorized_reward_fn:
+
+      def apply_action(observation, action):
+        features = gather_features(observation, action)
+        return np.asarray(reward_fn(features), dtype=np.float32)
+    elif self._pool is not None:
+      pool = self._pool
+
+      def apply_action(observation, action):
+        features = gather_features(observation, action)
+        reward = np.empty(batch_size, np.float32)
+        reward[:] = pool.map(reward_fn, features)
+        return reward
+    else:
+
+      def apply_action(observation, action):
+        features = gather_features(observation, action)
+        reward = np.empty(batch_size, np.float32)
+        for b, feature in enumerate(features):
+          reward[b] = reward_fn(feature)
+        return reward
+
+    return apply_action
+
+  def close(self) -> None:
+    if self._pool is not None:
+      self._pool.close()
+      self._pool.join()
+      self._pool = None
+      # Fall back to computing rewards serially, like
+      # `StationaryStochasticPyEnvironment` does after `close()`.
+      self._apply_action_fn = self._make_apply_action_fn()
+
+  def __del__(self):
+    """Join the reward function threads, if necessary."""
+    self.close()
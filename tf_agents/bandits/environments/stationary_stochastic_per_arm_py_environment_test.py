@@ -19,8 +19,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from absl.testing.absltest import mock
 import numpy as np
 import tensorflow as tf  # pylint: disable=g-explicit-tensorflow-version-import
+from tf_agents.bandits.environments import environment_utilities
+from tf_agents.bandits.environments import jit_utils
 from tf_agents.bandits.environments import stationary_stochastic_per_arm_py_environment as sspe
 from tf_agents.policies import random_py_policy
 from tf_agents.specs import array_spec
@@ -131,6 +134,283 @@ class StationaryStochasticPerArmBanditPyEnvironmentTest(tf.test.TestCase):
       self.assertAllLess(action, 6)
       time_step = env.step(action)
 
+  def test_with_batched_sampling(self):
+
+    def _global_context_sampling_fn(size):
+      return np.random.randint(-10, 10, [size, 4])
+
+    def _arm_context_sampling_fn(size):
+      return np.random.randint(-2, 3, [size, 5])
+
+    def _num_actions_fn(size):
+      return np.random.randint(0, 8, [size])
+
+    reward_fn = LinearNormalReward([0, 1, 2, 3, 4, 5, 6, 7, 8])
+
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        _global_context_sampling_fn,
+        _arm_context_sampling_fn,
+        6,
+        reward_fn,
+        _num_actions_fn,
+        batch_size=3,
+        batched_sampling=True)
+    time_step_spec = env.time_step_spec()
+    self.assertEqual(time_step_spec.observation[sspe.GLOBAL_KEY].shape, (4,))
+    self.assertEqual(time_step_spec.observation[sspe.PER_ARM_KEY].shape,
+                     (6, 5))
+
+    for _ in range(5):
+      time_step = env.reset()
+      self.assertTrue(
+          check_unbatched_time_step_spec(
+              time_step=time_step,
+              time_step_spec=time_step_spec,
+              batch_size=env.batch_size))
+      num_actions = time_step.observation[sspe.NUM_ACTIONS_KEY]
+      self.assertAllGreaterEqual(num_actions, 1)
+      self.assertAllLessEqual(num_actions, 6)
+      time_step = env.step(np.array([0, 3, 5], dtype=np.int32))
+      self.assertAllEqual(time_step.reward.shape, [3])
+
+  def test_vectorized_reward_fn(self):
+
+    def _global_context_sampling_fn():
+      return np.array([1, 2])
+
+    def _arm_context_sampling_fn():
+      return np.array([3, 4, 5])
+
+    def _reward_fn(x):
+      self.assertAllEqual(x.shape, [4, 5])
+      return np.sum(x, axis=1)
+
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        _global_context_sampling_fn,
+        _arm_context_sampling_fn,
+        3,
+        _reward_fn,
+        batch_size=4,
+        vectorized_reward_fn=True)
+    env.reset()
+    time_step = env.step(np.array([0, 1, 2, 1], dtype=np.int32))
+    self.assertAllEqual(time_step.reward, [15, 15, 15, 15])
+    self.assertEqual(time_step.reward.dtype, np.float32)
+
+  def test_reuse_observation_buffers(self):
+
+    def _global_context_sampling_fn():
+      return np.random.randint(-10, 10, [4])
+
+    def _arm_context_sampling_fn():
+      return np.random.randint(-2, 3, [5])
+
+    def _num_actions_fn():
+      return np.random.randint(0, 7)
+
+    reward_fn = LinearNormalReward([0, 1, 2, 3, 4, 5, 6, 7, 8])
+
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        _global_context_sampling_fn,
+        _arm_context_sampling_fn,
+        6,
+        reward_fn,
+        _num_actions_fn,
+        batch_size=2,
+        reuse_observation_buffers=True)
+    first_observation = env.reset().observation
+    second_observation = env.step(np.array([0, 1], dtype=np.int32)).observation
+    self.assertIs(first_observation, second_observation)
+    self.assertAllInRange(second_observation[sspe.NUM_ACTIONS_KEY], 1, 6)
+    self.assertIs(first_observation[sspe.GLOBAL_KEY],
+                  second_observation[sspe.GLOBAL_KEY])
+    self.assertIs(first_observation[sspe.PER_ARM_KEY],
+                  second_observation[sspe.PER_ARM_KEY])
+    self.assertAllEqual(second_observation[sspe.PER_ARM_KEY].shape, [2, 6, 5])
+
+  def test_parallel_reward_fn(self):
+
+    def _global_context_sampling_fn():
+      return np.array([1, 2])
+
+    def _arm_context_sampling_fn():
+      return np.array([3, 4, 5])
+
+    def _reward_fn(x):
+      return np.dot(x, [1, 0, 2, 0, 1])
+
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        _global_context_sampling_fn,
+        _arm_context_sampling_fn,
+        3,
+        _reward_fn,
+        batch_size=4,
+        reward_fn_workers=2)
+    env.reset()
+    time_step = env.step(np.array([0, 1, 2, 1], dtype=np.int32))
+    self.assertAllEqual(time_step.reward, [12, 12, 12, 12])
+    env.close()
+    # After `close()` the rewards are computed serially.
+    time_step = env.step(np.array([2, 2, 0, 1], dtype=np.int32))
+    self.assertAllEqual(time_step.reward, [12, 12, 12, 12])
+
+  def test_jit_reward_fn(self):
+
+    def _global_context_sampling_fn():
+      return np.array([1, 2])
+
+    def _arm_context_sampling_fn():
+      return np.array([3, 4, 5])
+
+    def _reward_fn(x):
+      return np.sum(x * x)
+
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        _global_context_sampling_fn,
+        _arm_context_sampling_fn,
+        3,
+        _reward_fn,
+        batch_size=2,
+        jit_reward_fn=True)
+    if jit_utils.is_available():
+      self.assertIs(env._reward_fn.py_func, _reward_fn)  # pylint: disable=protected-access
+    else:
+      self.assertIs(env._reward_fn, _reward_fn)  # pylint: disable=protected-access
+    env.reset()
+    time_step = env.step(np.array([0, 2], dtype=np.int32))
+    self.assertAllEqual(time_step.reward, [55, 55])
+
+  def test_uniform_int_sampler(self):
+    sampler = environment_utilities.make_uniform_int_sampler(
+        -2, 3, [5], rng=np.random.default_rng(0))
+    single = sampler()
+    batch = sampler(7)
+    self.assertEqual(single.shape, (5,))
+    self.assertEqual(batch.shape, (7, 5))
+    self.assertEqual(batch.dtype, np.int64)
+    self.assertAllInRange(batch, -2, 2)
+    float_sampler = environment_utilities.make_uniform_int_sampler(
+        -2, 3, [5], dtype=np.float32)
+    self.assertEqual(float_sampler(3).dtype, np.float32)
+
+  def test_normal_sampler(self):
+    sampler = environment_utilities.make_normal_sampler(
+        [2, 3], loc=1.0, scale=2.0, rng=np.random.default_rng(0))
+    self.assertEqual(sampler().shape, (2, 3))
+    self.assertEqual(sampler(4).shape, (4, 2, 3))
+    self.assertEqual(sampler(4).dtype, np.float32)
+
+  def test_samplers_are_reproducible_with_seeded_rng(self):
+    samplers_and_args = [
+        (environment_utilities.make_uniform_int_sampler, (0, 10, [3])),
+        (environment_utilities.make_normal_sampler, ([3],)),
+    ]
+    for make_sampler, args in samplers_and_args:
+      first = make_sampler(*args, rng=np.random.default_rng(42))
+      second = make_sampler(*args, rng=np.random.default_rng(42))
+      self.assertAllEqual(first(), second())
+      self.assertAllEqual(first(6), second(6))
+
+  def test_batched_sampling_with_samplers(self):
+    rng = np.random.default_rng(0)
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        environment_utilities.make_uniform_int_sampler(0, 10, [2], rng=rng),
+        environment_utilities.make_uniform_int_sampler(-3, 4, [3], rng=rng),
+        5,
+        np.sum,
+        lambda size: rng.integers(2, 6, [size]),
+        batch_size=4,
+        batched_sampling=True)
+    time_step_spec = env.time_step_spec()
+    self.assertEqual(time_step_spec.observation[sspe.GLOBAL_KEY].shape, (2,))
+    self.assertEqual(time_step_spec.observation[sspe.PER_ARM_KEY].shape,
+                     (5, 3))
+    time_step = env.reset()
+    self.assertTrue(
+        check_unbatched_time_step_spec(
+            time_step=time_step,
+            time_step_spec=time_step_spec,
+            batch_size=env.batch_size))
+    self.assertAllInRange(time_step.observation[sspe.NUM_ACTIONS_KEY], 2, 5)
+    time_step = env.step(np.array([0, 1, 2, 1], dtype=np.int32))
+    self.assertAllEqual(time_step.reward.shape, [4])
+
+  def test_batched_num_actions_fn_output_is_not_modified(self):
+
+    def _global_context_sampling_fn(size):
+      return np.random.randint(-10, 10, [size, 4])
+
+    def _arm_context_sampling_fn(size):
+      return np.random.randint(-2, 3, [size, 5])
+
+    cached_num_actions = np.array([0, 3, 9], dtype=np.int64)
+    read_only_num_actions = np.broadcast_to(np.int64(8), (3,))
+    reward_fn = LinearNormalReward([0, 1, 2, 3, 4, 5, 6, 7, 8])
+
+    for num_actions in (cached_num_actions, read_only_num_actions):
+      expected = num_actions.copy()
+      env = sspe.StationaryStochasticPerArmPyEnvironment(
+          _global_context_sampling_fn,
+          _arm_context_sampling_fn,
+          6,
+          reward_fn,
+          lambda size, n=num_actions: n,
+          batch_size=3,
+          batched_sampling=True)
+      time_step = env.reset()
+      self.assertAllEqual(time_step.observation[sspe.NUM_ACTIONS_KEY],
+                          np.clip(expected, 1, 6))
+      self.assertAllEqual(num_actions, expected)
+
+  def test_jit_reward_fn_with_workers(self):
+    if not jit_utils.is_available():
+      self.skipTest('numba is not installed.')
+
+    def _global_context_sampling_fn():
+      return np.array([1, 2])
+
+    def _arm_context_sampling_fn():
+      return np.array([3, 4, 5])
+
+    def _reward_fn(x):
+      return np.sum(x * x)
+
+    env = sspe.StationaryStochasticPerArmPyEnvironment(
+        _global_context_sampling_fn,
+        _arm_context_sampling_fn,
+        3,
+        _reward_fn,
+        batch_size=4,
+        jit_reward_fn=True,
+        reward_fn_workers=2)
+    self.assertTrue(env._reward_fn.targetoptions['nogil'])  # pylint: disable=protected-access
+    env.reset()
+    time_step = env.step(np.array([0, 1, 2, 1], dtype=np.int32))
+    self.assertAllEqual(time_step.reward, [55, 55, 55, 55])
+    env.close()
+
+  def test_warns_about_float64_contexts(self):
+    reward_fn = LinearNormalReward([0, 1, 2, 3, 4, 5, 6, 7, 8])
+    with self.assertLogs(logger='absl', level='WARNING') as logs:
+      sspe.StationaryStochasticPerArmPyEnvironment(
+          lambda: np.random.normal(size=[4]),
+          lambda: np.random.normal(size=[5]).astype(np.float32),
+          6,
+          reward_fn)
+    self.assertLen(logs.output, 1)
+    self.assertIn('float64', logs.output[0])
+    self.assertIn(sspe.GLOBAL_KEY, logs.output[0])
+
+  def test_does_not_warn_about_float32_contexts(self):
+    reward_fn = LinearNormalReward([0, 1, 2, 3, 4, 5, 6, 7, 8])
+    with mock.patch.object(sspe.logging, 'warning') as warning:
+      sspe.StationaryStochasticPerArmPyEnvironment(
+          lambda: np.random.normal(size=[4]).astype(np.float32),
+          lambda: np.random.normal(size=[5]).astype(np.float32),
+          6,
+          reward_fn)
+    warning.assert_not_called()
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -15,12 +15,15 @@
 
 """Class implementation of Stationary Stochastic Python Bandit environment."""
 
+from multiprocessing import dummy as mp_threads
 from typing import Optional, Callable, Sequence, Text
 
+from absl import logging
 import gin
 import numpy as np
 
 from tf_agents.bandits.environments import bandit_py_environment
+from tf_agents.bandits.environments import jit_utils
 from tf_agents.bandits.specs import utils as bandits_spec_utils
 from tf_agents.specs import array_spec
 from tf_agents.typing import types
@@ -38,6 +41,9 @@ class StationaryStochasticPyEnvironment(
       constraint_fns: Optional[
           Sequence[Callable[[np.ndarray], Sequence[float]]]] = None,
       batch_size: Optional[int] = 1,
+      vectorized_reward_fns: bool = False,
+      jit_reward_fns: bool = False,
+      reward_fn_workers: int = 1,
       name: Optional[Text] = 'stationary_stochastic'):
     """Initializes a Stationary Stochastic Bandit environment.
 
@@ -45,8 +51,10 @@ class StationaryStochasticPyEnvironment(
     passed through a reward_function for each arm.
 
     Example:
+      rng = np.random.default_rng()
+
       def context_sampling_fn():
-        return np.random.randint(0, 10, [1, 2])  # 2-dim ints between 0 and 10
+        return rng.integers(0, 10, [1, 2])  # 2-dim ints between 0 and 10
 
       def reward_fn1(x):
         return x[0]
@@ -59,20 +67,42 @@ class StationaryStochasticPyEnvironment(
 
     Args:
       context_sampling_fn: A function that outputs a random 2d array or list of
-        ints or floats, where the first dimension is batch size.
+        ints or floats, where the first dimension is batch size. Returning
+        float32 rather than float64 arrays is recommended.
       reward_fns: A function that generates a (perhaps non-scalar) reward when
         called with an observation.
       constraint_fns: A function that generates a (perhaps non-scalar)
         constraint metric when called with an observation.
       batch_size: The batch size. Must match the outer dimension of the output
         of context_sampling_fn.
+      vectorized_reward_fns: If True, the reward and constraint functions are
+        called with a 2d array of all observations in the batch for which the
+        corresponding arm was chosen, and must return one (perhaps non-scalar)
+        value per row. Each function is then called at most once per step.
+      jit_reward_fns: If True and numba is installed, the reward and constraint
+        functions are compiled with `numba.njit`. Only plain Python functions
+        are compiled.
+      reward_fn_workers: If larger than 1, the per-row calls of the reward and
+        constraint functions are distributed over a thread pool of this size.
+        This only pays off if the functions are expensive and release the GIL
+        (e.g. functions compiled with `jit_reward_fns`). Functions drawing from
+        the global `np.random` state on several threads are no longer
+        reproducible under `np.random.seed`. Ignored if `vectorized_reward_fns`
+        is True. Call `close()` to release the pool.
       name: The name of this environment instance.
     """
+    # Set first, so that `close()` works even if the constructor raises.
+    self._pool = None
+    if jit_reward_fns:
+      reward_fns = [jit_utils.maybe_njit(fn) for fn in reward_fns]
+      if constraint_fns is not None:
+        constraint_fns = [jit_utils.maybe_njit(fn) for fn in constraint_fns]
     self._context_sampling_fn = context_sampling_fn
     self._reward_fns = reward_fns
     self._num_actions = len(reward_fns)
     self._constraint_fns = constraint_fns
     self._batch_size = batch_size
+    self._vectorized_reward_fns = vectorized_reward_fns
 
     action_spec = array_spec.BoundedArraySpec(
         shape=(),
@@ -83,6 +113,10 @@ class StationaryStochasticPyEnvironment(
 
     example_observation = self._context_sampling_fn()
     observation_spec = array_spec.ArraySpec.from_array(example_observation[0])
+    if observation_spec.dtype == np.float64:
+      logging.warning(
+          'The context sampling function returns float64 contexts. Returning '
+          'float32 halves the memory moved by every step.')
     if example_observation.shape[0] != batch_size:
       raise ValueError(
           'The outer dimension of the observations should match the batch size.'
@@ -91,11 +125,21 @@ class StationaryStochasticPyEnvironment(
     # Figure out the reward spec.
     # If we have constraints, the reward_spec will be a nested dict with keys:
     # 'reward' and 'constraint' (defined in tf_agents.bandits.specs.utils).
-    example_reward = np.asarray(reward_fns[0](example_observation[0]))
+    if vectorized_reward_fns:
+      example_reward = np.asarray(reward_fns[0](example_observation[:1]))[0]
+    else:
+      example_reward = np.asarray(reward_fns[0](example_observation[0]))
+    self._reward_shape = example_reward.shape
     reward_spec = array_spec.ArraySpec(
         example_reward.shape, np.float32, name='reward')
     if self._constraint_fns is not None:
-      example_constraint = np.asarray(constraint_fns[0](example_observation[0]))
+      if vectorized_reward_fns:
+        example_constraint = np.asarray(
+            constraint_fns[0](example_observation[:1]))[0]
+      else:
+        example_constraint = np.asarray(
+            constraint_fns[0](example_observation[0]))
+      self._constraint_shape = example_constraint.shape
       constraint_spec = array_spec.ArraySpec(
           example_constraint.shape, np.float32, name='constraint')
       reward_spec = {
@@ -106,6 +150,10 @@ class StationaryStochasticPyEnvironment(
     super(StationaryStochasticPyEnvironment, self).__init__(
         observation_spec, action_spec, reward_spec, name=name)
 
+    # Only started once all arguments have been validated.
+    if reward_fn_workers > 1 and not vectorized_reward_fns:
+      self._pool = mp_threads.Pool(reward_fn_workers)
+
   def batched(self) -> bool:
     return True
 
@@ -118,16 +166,52 @@ class StationaryStochasticPyEnvironment(
     return self._observation
 
   def _apply_action(self, action: types.NestedArray) -> types.NestedArray:
-    if len(action) != self.batch_size:
+    if len(action) != self._batch_size:
       raise ValueError('Number of actions must match batch size.')
-    reward = np.stack(
-        [self._reward_fns[a](o) for a, o in zip(action, self._observation)])  # pytype: disable=attribute-error  # trace-all-classes
+    if self._vectorized_reward_fns:
+      action = np.asarray(action)
+      call_fns = self._call_per_action
+    else:
+      call_fns = self._call_per_row
+    reward = call_fns(self._reward_fns, action, self._reward_shape)
     if self._constraint_fns is not None:
-      constraint = np.stack(
-          [self._constraint_fns[a](o) for a, o in zip(action,
-                                                      self._observation)])  # pytype: disable=attribute-error  # trace-all-classes
+      constraint = call_fns(self._constraint_fns, action,
+                            self._constraint_shape)
       reward = {
           bandits_spec_utils.REWARD_SPEC_KEY: reward,
           bandits_spec_utils.CONSTRAINTS_SPEC_KEY: constraint
       }
     return reward
+
+  def _call_per_row(self, fns: Sequence[Callable[[np.ndarray], types.Array]],
+                    action: types.Array,
+                    output_shape: Sequence[int]) -> np.ndarray:
+    """Calls `fns[a]` on every observation row, one row at a time."""
+    output = np.empty((self._batch_size,) + tuple(output_shape), np.float32)
+    if self._pool is not None:
+      output[:] = self._pool.starmap(lambda a, o: fns[a](o),
+                                     zip(action, self._observation))  # pytype: disable=attribute-error  # trace-all-classes
+    else:
+      for b, (a, o) in enumerate(zip(action, self._observation)):  # pytype: disable=attribute-error  # trace-all-classes
+        output[b] = fns[a](o)
+    return output
+
+  def _call_per_action(self, fns: Sequence[Callable[[np.ndarray], types.Array]],
+                       action: np.ndarray,
+                       output_shape: Sequence[int]) -> np.ndarray:
+    """Calls `fns[a]` once on all observations for which arm `a` was chosen."""
+    output = np.empty((self._batch_size,) + tuple(output_shape), np.float32)
+    for a in np.unique(action):
+      indices = np.flatnonzero(action == a)
+      output[indices] = fns[a](self._observation[indices])  # pytype: disable=attribute-error  # trace-all-classes
+    return output
+
+  def close(self) -> None:
+    if self._pool is not None:
+      self._pool.close()
+      self._pool.join()
+      self._pool = None
+
+  def __del__(self):
+    """Join the reward function threads, if necessary."""
+    self.close()
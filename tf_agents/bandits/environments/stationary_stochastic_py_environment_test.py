@@ -19,8 +19,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from absl.testing.absltest import mock
 import numpy as np
 import tensorflow as tf  # pylint: disable=g-explicit-tensorflow-version-import
+from tf_agents.bandits.environments import jit_utils
 from tf_agents.bandits.environments import stationary_stochastic_py_environment as sspe
 from tf_agents.policies import random_py_policy
 from tf_agents.specs import array_spec
@@ -229,6 +231,94 @@ class StationaryStochasticBanditPyEnvironmentTest(tf.test.TestCase):
     self.assertEqual(time_step_spec.reward['reward'].shape[0], 2)
     self.assertEqual(time_step_spec.reward['constraint'].shape[0], 2)
 
+  def test_vectorized_reward_fns(self):
+
+    def _context_sampling_fn():
+      return np.array([[4, 3], [4, 3], [5, 6], [1, 2]])
+
+    # Vectorized reward functions are called with one row per matching action.
+    reward_fns = [
+        LinearDeterministicReward(theta)
+        for theta in ([0, 1], [1, 2], [2, 3])
+    ]
+    # A 2x2 theta maps every observation row to a 2-dimensional constraint.
+    constraint_fns = [
+        LinearDeterministicReward(np.array(theta))
+        for theta in ([[1, 0], [0, 1]], [[1, 1], [1, 1]], [[2, 0], [0, 2]])
+    ]
+    env = sspe.StationaryStochasticPyEnvironment(
+        _context_sampling_fn,
+        reward_fns,
+        constraint_fns,
+        batch_size=4,
+        vectorized_reward_fns=True)
+    env.reset()
+    time_step = env.step(np.array([0, 1, 0, 2]))
+    self.assertAllEqual(time_step.reward['reward'], [3, 10, 6, 8])
+    self.assertAllEqual(time_step.reward['constraint'],
+                        [[4, 3], [7, 7], [5, 6], [2, 4]])
+    time_step_spec = env.time_step_spec()
+    self.assertEqual(time_step_spec.reward['reward'].shape, ())
+    self.assertEqual(time_step_spec.reward['constraint'].shape, (2,))
+
+  def test_parallel_reward_fns(self):
+
+    def _context_sampling_fn():
+      return np.array([[4, 3], [4, 3], [5, 6]])
+
+    reward_fns = [
+        LinearDeterministicReward(theta)
+        for theta in ([0, 1], [1, 2], [2, 3], [3, 4])
+    ]
+    env = sspe.StationaryStochasticPyEnvironment(
+        _context_sampling_fn, reward_fns, batch_size=3, reward_fn_workers=2)
+    env.reset()
+    time_step = env.step([0, 1, 3])
+    self.assertAllEqual(time_step.reward, [3, 10, 39])
+    env.close()
+    # After `close()` the rewards are computed serially.
+    time_step = env.step([3, 2, 0])
+    self.assertAllEqual(time_step.reward, [24, 17, 6])
+
+  def test_jit_reward_fns(self):
+
+    def _context_sampling_fn():
+      return np.array([[4, 3], [5, 6]])
+
+    def _reward_fn_0(x):
+      return x[0]
+
+    def _reward_fn_1(x):
+      return x[0] * x[1]
+
+    reward_fns = [_reward_fn_0, _reward_fn_1]
+    env = sspe.StationaryStochasticPyEnvironment(
+        _context_sampling_fn, reward_fns, batch_size=2, jit_reward_fns=True)
+    if jit_utils.is_available():
+      self.assertIs(env._reward_fns[0].py_func, _reward_fn_0)  # pylint: disable=protected-access
+      self.assertIs(env._reward_fns[1].py_func, _reward_fn_1)  # pylint: disable=protected-access
+    else:
+      self.assertIs(env._reward_fns[0], _reward_fn_0)  # pylint: disable=protected-access
+      self.assertIs(env._reward_fns[1], _reward_fn_1)  # pylint: disable=protected-access
+    env.reset()
+    time_step = env.step([1, 0])
+    self.assertAllEqual(time_step.reward, [12, 5])
+
+  def test_warns_about_float64_contexts(self):
+    with self.assertLogs(logger='absl', level='WARNING') as logs:
+      sspe.StationaryStochasticPyEnvironment(
+          lambda: np.random.normal(0, 3, [1, 2]),
+          [LinearDeterministicReward([1, 2])])
+    self.assertLen(logs.output, 1)
+    self.assertIn('float64', logs.output[0])
+
+  def test_does_not_warn_about_float32_contexts(self):
+    with mock.patch.object(sspe.logging, 'warning') as warning:
+      sspe.StationaryStochasticPyEnvironment(
+          lambda: np.random.normal(0, 3, [1, 2]).astype(np.float32),
+          [LinearDeterministicReward([1, 2])])
+    warning.assert_not_called()
+
 
 if __name__ == '__main__':
   tf.test.main()